@@ -58,3 +58,395 @@ print(q)  # deque([4, 1, 2])
 print(q.popleft())  # 4
 
 #  Adding or popping from the ends of a queue is O(1) complexity
+
+# Extension
+#  search() runs a Python loop over every line of the file, which
+#   is slow when grepping multi-GB logs. Memory mapping the file
+#   lets a compiled regex scan the raw bytes instead, and joining
+#   several patterns into one alternation matches all of them in
+#   a single pass.
+#  Only lines that match are ever split out. The line boundaries
+#   around a hit are found with rfind()/find() for b'\n', and the
+#   same calls walk backwards (or forwards) to collect the context
+#   lines, so the cost depends on the number of matches rather than
+#   on the number of lines.
+#  Each match is yielded as (line, previous_lines, next_lines), with
+#   lines decoded and newlines kept, just like iterating over a file.
+
+import mmap
+import os
+import re
+import sys
+
+
+def _context(mm, start, end, count, forward):
+    lines = []
+    for _ in range(count):
+        if forward:
+            if start >= len(mm):
+                break
+            end = mm.find(b'\n', start)
+            end = len(mm) if end == -1 else end + 1
+            lines.append(mm[start:end])
+            start = end
+        else:
+            if end <= 0:
+                break
+            start = mm.rfind(b'\n', 0, end - 1) + 1
+            lines.append(mm[start:end])
+            end = start
+    return lines if forward else lines[::-1]
+
+
+def _compile_patterns(patterns, encoding):
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    return re.compile(b'|'.join(re.escape(p.encode(encoding))
+                                for p in patterns))
+
+
+def _search_range(mm, regex, pos, stop, history, after, encoding):
+    while True:
+        match = regex.search(mm, pos, stop)
+        if match is None:
+            break
+        start = mm.rfind(b'\n', 0, match.start()) + 1
+        end = mm.find(b'\n', match.end())
+        end = len(mm) if end == -1 else end + 1
+        before = _context(mm, start, start, history, forward=False)
+        following = _context(mm, end, end, after, forward=True)
+        yield (mm[start:end].decode(encoding),
+               [line.decode(encoding) for line in before],
+               [line.decode(encoding) for line in following])
+        pos = end
+
+
+def search_mmap(filename, patterns, history=5, after=0, encoding='utf-8'):
+    regex = _compile_patterns(patterns, encoding)
+    if os.path.getsize(filename) == 0:
+        return
+    with open(filename, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        yield from _search_range(mm, regex, 0, len(mm),
+                                 history, after, encoding)
+
+
+if __name__ == '__main__':
+    for line, prevlines, nextlines in search_mmap(
+            'somefile.txt', ['python', 'docker'], history=2, after=1):
+        print(''.join(prevlines), end='')
+        print(line, end='')
+        print(''.join(nextlines), end='')
+        print('-'*20)
+
+#  Benchmark against search() on a generated log, where roughly one
+#   line in a thousand matches. The benchmarks in this recipe take a
+#   while, so they only run when the recipe is run with --bench.
+
+
+def bench_search(lines=1000000):
+    import tempfile
+    import time
+    with tempfile.NamedTemporaryFile('w', suffix='.log', delete=False) as f:
+        for i in range(lines):
+            f.write('python\n' if i % 1000 == 0 else
+                    'INFO request {} handled in {}ms\n'.format(i, i % 97))
+    try:
+        start = time.perf_counter()
+        with open(f.name) as lines_in:
+            hits = sum(1 for _ in search(lines_in, 'python', 5))
+        print('search():      {:.2f}s, {} hits'.format(
+            time.perf_counter() - start, hits))
+        start = time.perf_counter()
+        hits = sum(1 for _ in search_mmap(f.name, ['python'], 5))
+        print('search_mmap(): {:.2f}s, {} hits'.format(
+            time.perf_counter() - start, hits))
+    finally:
+        os.remove(f.name)
+
+
+if __name__ == '__main__' and '--bench' in sys.argv:
+    bench_search()
+
+#  A single scan still uses only one core. The file can instead be
+#   split into byte ranges and scanned by a pool of processes.
+#   Range boundaries are moved forward to the next line start, so
+#   every line belongs to exactly one range.
+#  Each worker maps the whole file but only looks for matches in its
+#   own range. The context lines are read from the mapping, so a
+#   match near the start of a range still gets the history lines
+#   from the range before it, with no overlap or stitching needed.
+#  executor.map() returns the ranges in order, so the matches come
+#   back as a stream in file order. Splitting into several ranges
+#   per worker keeps the pool busy when matches are unevenly spread.
+
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _line_ranges(filename, count):
+    with open(filename, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        bounds = [0]
+        for i in range(1, count):
+            start = mm.find(b'\n', size * i // count - 1) + 1 or size
+            bounds.append(max(start, bounds[-1]))
+        bounds.append(size)
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:])
+            if start < stop]
+
+
+def _search_chunk(args):
+    filename, patterns, start, stop, history, after, encoding = args
+    regex = _compile_patterns(patterns, encoding)
+    with open(filename, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return list(_search_range(mm, regex, start, stop,
+                                  history, after, encoding))
+
+
+def search_parallel(filename, patterns, history=5, after=0,
+                    encoding='utf-8', workers=None, chunks_per_worker=4):
+    if os.path.getsize(filename) == 0:
+        return
+    workers = workers or os.cpu_count()
+    ranges = _line_ranges(filename, workers * chunks_per_worker)
+    tasks = [(filename, patterns, start, stop, history, after, encoding)
+             for start, stop in ranges]
+    with ProcessPoolExecutor(workers) as executor:
+        for matches in executor.map(_search_chunk, tasks):
+            yield from matches
+
+
+if __name__ == '__main__':
+    for line, prevlines, _ in search_parallel('somefile.txt', 'python',
+                                              history=5, workers=2):
+        print(''.join(prevlines), end='')
+        print(line, end='')
+        print('-'*20)
+
+#  The scan time should drop roughly linearly with the number of
+#   workers, until the disk (or page cache) can't keep up.
+
+
+def bench_search_parallel(lines=2000000):
+    import tempfile
+    import time
+    with tempfile.NamedTemporaryFile('w', suffix='.log', delete=False) as f:
+        for i in range(lines):
+            f.write('python\n' if i % 1000 == 0 else
+                    'INFO request {} handled in {}ms\n'.format(i, i % 97))
+    try:
+        for workers in range(1, os.cpu_count() + 1):
+            start = time.perf_counter()
+            hits = sum(1 for _ in search_parallel(
+                f.name, ['python', 'in 96ms'], 5, workers=workers))
+            print('{} workers: {:.2f}s, {} hits'.format(
+                workers, time.perf_counter() - start, hits))
+    finally:
+        os.remove(f.name)
+
+
+if __name__ == '__main__' and '--bench' in sys.argv:
+    bench_search_parallel()
+
+#  deque(maxlen=N) is handy for keeping a window of recent numbers,
+#   but recomputing sum(), min(), max() or the variance over it on
+#   every new sample is O(N). A RollingWindow keeps those aggregates
+#   up to date as samples enter and leave the window instead.
+#  The samples are stored as unboxed doubles in an array('d') used
+#   as a ring buffer, so each one takes 8 bytes rather than the
+#   24-byte float object plus the 8-byte pointer a deque stores.
+#  The mean and variance are maintained with Welford's method, which
+#   can add and remove samples without the cancellation errors of
+#   keeping a running sum of squares.
+#  min and max are kept in monotonic deques. Each new sample pops
+#   the values it makes irrelevant off the back, so the front is
+#   always the current minimum (or maximum), and every sample is
+#   pushed and popped at most once.
+#   The deques only hold the ring buffer slots of their samples (the
+#   values are read from the buffer), and they are ring buffers of
+#   their own, in an array of 2- or 4-byte slot numbers. A slot
+#   leaves the front of a deque when its sample is overwritten.
+#   Either deque can hold the whole window (the min deque does, on
+#   rising data), so this keeps the worst case at 12 to 16 bytes
+#   per sample, with no Python objects at all.
+#  extend() takes a batch of samples from any iterable. When NumPy
+#   is installed and a list, tuple, array or ndarray fills the whole
+#   window, the aggregates are recomputed from the last N samples in
+#   one vectorized pass.
+
+import random
+from array import array
+from operator import ge, le
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class RollingWindow:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buffer = array('d', [0.0]) * capacity
+        self._count = 0
+        self._size = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        #  Monotonic deques: [ring of buffer slots, head, length]
+        slot_type = 'H' if capacity <= 1 << 16 else 'I'
+        self._mins = [array(slot_type, [0]) * capacity, 0, 0]
+        self._maxes = [array(slot_type, [0]) * capacity, 0, 0]
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for pos in range(self._count - len(self), self._count):
+            yield self._buffer[pos % self.capacity]
+
+    def append(self, value):
+        value = float(value)
+        slot = self._count % self.capacity
+        if self._count >= self.capacity:
+            self._remove(self._buffer[slot])
+            self._expire(self._mins, slot)
+            self._expire(self._maxes, slot)
+        self._buffer[slot] = value
+        self._add(value)
+        self._push_extreme(self._mins, slot, value, le)
+        self._push_extreme(self._maxes, slot, value, ge)
+        self._count += 1
+
+    def _add(self, value):
+        self._size += 1
+        n = self._size
+        delta = value - self._mean
+        self._mean += delta / n
+        self._m2 += delta * (value - self._mean)
+
+    def _remove(self, value):
+        self._size -= 1
+        n = self._size
+        if n == 0:
+            self._mean = self._m2 = 0.0
+            return
+        delta = value - self._mean
+        self._mean -= delta / n
+        self._m2 -= delta * (value - self._mean)
+
+    def _expire(self, extremes, slot):
+        ring, head, length = extremes
+        if length and ring[head] == slot:
+            extremes[1] = (head + 1) % self.capacity
+            extremes[2] = length - 1
+
+    def _push_extreme(self, extremes, slot, value, keeps):
+        ring, head, length = extremes
+        buffer = self._buffer
+        capacity = self.capacity
+        while length and not keeps(
+                buffer[ring[(head + length - 1) % capacity]], value):
+            length -= 1
+        ring[(head + length) % capacity] = slot
+        extremes[2] = length + 1
+
+    def extend(self, values):
+        if (np is None or
+                not isinstance(values, (list, tuple, array, np.ndarray)) or
+                len(values) < self.capacity):
+            for value in values:
+                self.append(value)
+            return
+        window = np.asarray(values[-self.capacity:], dtype='d')
+        self._count += len(values)
+        start = self._count % self.capacity
+        self._buffer = array('d', np.roll(window, start).tobytes())
+        self._size = self.capacity
+        self._mean = float(window.mean())
+        self._m2 = float(((window - self._mean) ** 2).sum())
+        #  Rebuild the monotonic deques from the window itself
+        self._mins[1:] = self._maxes[1:] = [0, 0]
+        for pos in range(self._count - self.capacity, self._count):
+            slot = pos % self.capacity
+            value = self._buffer[slot]
+            self._push_extreme(self._mins, slot, value, le)
+            self._push_extreme(self._maxes, slot, value, ge)
+
+    @property
+    def sum(self):
+        return self._mean * len(self)
+
+    @property
+    def mean(self):
+        return self._mean
+
+    @property
+    def min(self):
+        ring, head, _ = self._mins
+        return self._buffer[ring[head]]
+
+    @property
+    def max(self):
+        ring, head, _ = self._maxes
+        return self._buffer[ring[head]]
+
+    @property
+    def variance(self):
+        n = len(self)
+        return self._m2 / (n - 1) if n > 1 else 0.0
+
+
+w = RollingWindow(3)
+for value in [1, 5, 2, 8, 3]:
+    w.append(value)
+print(list(w))  # [2.0, 8.0, 3.0]
+print(w.sum, w.min, w.max)  # 13.0 2.0 8.0
+print(round(w.variance, 2))  # 10.33
+
+#  The benchmark compares updating a RollingWindow with appending to
+#   a deque and recomputing the same aggregates over it. It then
+#   fills both with a rising series (the worst case for the min
+#   deque) and measures everything each one allocated with
+#   tracemalloc, including the float objects a deque keeps alive.
+#   With a 10,000-sample window that is about 120 KB for a
+#   RollingWindow against about 320 KB for the deque.
+
+
+def bench_rolling(capacity=1000, samples=5000, memory_capacity=10000):
+    import statistics
+    import time
+    import tracemalloc
+    data = [random.random() for _ in range(samples)]
+
+    start = time.perf_counter()
+    q = deque(maxlen=capacity)
+    for value in data:
+        q.append(value)
+        sum(q), min(q), max(q)
+        statistics.variance(q) if len(q) > 1 else 0.0
+    print('deque + recompute: {:.2f}s'.format(time.perf_counter() - start))
+
+    start = time.perf_counter()
+    w = RollingWindow(capacity)
+    for value in data:
+        w.append(value)
+        w.sum, w.min, w.max, w.variance
+    print('RollingWindow:     {:.2f}s'.format(time.perf_counter() - start))
+
+    sizes = []
+    for window in (lambda: deque(maxlen=memory_capacity),
+                   lambda: RollingWindow(memory_capacity)):
+        tracemalloc.start()
+        w = window()
+        for i in range(2 * memory_capacity):
+            w.append(i * 0.5)
+        sizes.append(tracemalloc.get_traced_memory()[0])
+        tracemalloc.stop()
+        del w
+    print('memory: deque {:,} bytes, RollingWindow {:,} bytes'.format(*sizes))
+
+
+if __name__ == '__main__' and '--bench' in sys.argv:
+    bench_rolling()
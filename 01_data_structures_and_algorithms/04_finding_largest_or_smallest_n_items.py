@@ -49,3 +49,276 @@ print(heapq.heappop(heap))  # 2
 #  and take the slice you need (sorted(items)[:N] or sorted(items)[-N:]).
 #  The two heapq functions are adaptive and optimized to these implementations,
 #  like using sorting if N is close to the size of the items.
+
+# Extension
+#  nlargest() and nsmallest() need the whole iterable up front and
+#   return one answer. When the data is streamed in (or is too big
+#   to fit in memory), a TopN accumulator can keep a heap of only
+#   the N best items seen so far, evicting the worst one whenever a
+#   better item arrives. Memory stays O(N) no matter how much data
+#   goes through it.
+#  Each heap entry is ranked by (key, position), so that equal keys
+#   are resolved the same way nlargest() and nsmallest() resolve
+#   them: the item seen first wins. For nsmallest(), the heap has to
+#   evict its largest entry, so the rank is wrapped in _Reversed.
+#  Giving each accumulator the position of its first item (start)
+#   lets the partial results of several workers be merged exactly,
+#   as if one accumulator had seen the whole stream.
+#  A worker often can't know where its part of the stream starts,
+#   though, and then several accumulators all start at 0. So each
+#   entry also carries a running number, given out by the heap that
+#   holds it (merged entries get new ones), which breaks any tie left
+#   in the rank. The items themselves are never compared; on a tie
+#   the entry that reached the heap first wins.
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class _Reversed:
+    __slots__ = ('rank',)
+
+    def __init__(self, rank):
+        self.rank = rank
+
+    def __lt__(self, other):
+        return other.rank < self.rank
+
+
+class TopN:
+    def __init__(self, n, key=None, largest=True, start=0):
+        self.n = n
+        self.key = key
+        self.largest = largest
+        self._heap = []
+        self._position = start
+        self._entries = 0
+
+    def _rank(self, item, position):
+        k = item if self.key is None else self.key(item)
+        if self.largest:
+            return (k, -position)
+        return _Reversed((k, position))
+
+    def _add(self, rank, item):
+        if len(self._heap) < self.n:
+            self._entries += 1
+            heapq.heappush(self._heap, (rank, -self._entries, item))
+        elif self._heap and self._heap[0][0] < rank:
+            self._entries += 1
+            heapq.heapreplace(self._heap, (rank, -self._entries, item))
+
+    def push(self, item):
+        self._add(self._rank(item, self._position), item)
+        self._position += 1
+
+    def update(self, items):
+        for item in items:
+            self.push(item)
+
+    def update_array(self, values):
+        #  Numeric chunks without a key can skip the Python loop for
+        #   most of their values. np.partition() finds the Nth best
+        #   value of the chunk in O(len), and only values at least
+        #   that good (ties included, so the result stays exact) are
+        #   pushed through the heap.
+        if np is None or self.key is not None:
+            return self.update(values)
+        values = np.asarray(values)
+        size = len(values)
+        if size > self.n > 0:
+            if self.largest:
+                kth = np.partition(values, size - self.n)[size - self.n]
+                keep = np.flatnonzero(values >= kth)
+            else:
+                kth = np.partition(values, self.n - 1)[self.n - 1]
+                keep = np.flatnonzero(values <= kth)
+        else:
+            keep = np.arange(size)
+        for offset, item in zip(keep.tolist(), values[keep].tolist()):
+            self._add(self._rank(item, self._position + offset), item)
+        self._position += size
+
+    def merge(self, other):
+        for rank, _, item in sorted(other._heap, reverse=True):
+            self._add(rank, item)
+        return self
+
+    def result(self):
+        return [item for _, _, item in sorted(self._heap, reverse=True)]
+
+
+top = TopN(3)
+top.update(nums)
+print(top.result())  # [42, 37, 23]
+
+#  The key argument works the same way as in nlargest(). Here two
+#   workers each see half of the portfolio, and their partial
+#   results are merged.
+first = TopN(3, key=lambda s: s['price'])
+first.update(portfolio[:3])
+second = TopN(3, key=lambda s: s['price'], start=3)
+second.update(portfolio[3:])
+print(first.merge(second).result() == expensive)  # True
+
+cheap_top = TopN(3, key=lambda s: s['price'], largest=False)
+cheap_top.update(portfolio)
+print(cheap_top.result() == cheap)  # True
+
+#  If NumPy is installed, chunks of numbers can be fed in bulk
+top = TopN(3, largest=False)
+top.update_array([1, 8, 2, 23, 7])
+top.update_array([-4, 18, 23, 42, 37, 2])
+print(top.result())  # [-4, 1, 2]
+
+#  The advice in the discussion (min()/max() for N=1, heaps for
+#   small N, sorting when N is close to the size of the items) can
+#   be turned into a dispatcher that picks the strategy for you.
+#  Timing on random floats shows one more case worth having. For
+#   large lists where N is a few percent of the items, a quickselect
+#   that finds the Nth best key in O(len) and only sorts the N
+#   winners beats both the heap and a full sort. For NumPy arrays,
+#   np.partition() does the same selection in C, and argmax() or
+#   argmin() finds a single best item without leaving C either.
+#  Like the heapq functions, every strategy returns the N best items
+#   from best to worst, with ties resolved in favor of the item that
+#   came first.
+
+import random
+import sys
+
+
+def _nth_key(keys, nth):
+    #  Quickselect: returns the nth smallest key (0-based)
+    while len(keys) > 32:
+        pivot = keys[random.randrange(len(keys))]
+        lows = [k for k in keys if k < pivot]
+        if nth < len(lows):
+            keys = lows
+            continue
+        highs = [k for k in keys if pivot < k]
+        equal = len(keys) - len(lows) - len(highs)
+        if nth < len(lows) + equal:
+            return pivot
+        nth -= len(lows) + equal
+        keys = highs
+    return sorted(keys)[nth]
+
+
+def _top_builtin(items, n, key, largest):
+    return [(max if largest else min)(items, key=key)]
+
+
+def _top_heap(items, n, key, largest):
+    return (heapq.nlargest if largest else heapq.nsmallest)(n, items, key=key)
+
+
+def _top_sort(items, n, key, largest):
+    return sorted(items, key=key, reverse=largest)[:n]
+
+
+def _top_select(items, n, key, largest):
+    keys = items if key is None else list(map(key, items))
+    if largest:
+        nth = _nth_key(keys, len(keys) - n)
+        picked = [i for i, k in enumerate(keys) if nth < k]
+    else:
+        nth = _nth_key(keys, n - 1)
+        picked = [i for i, k in enumerate(keys) if k < nth]
+    ties = (i for i, k in enumerate(keys) if k == nth)
+    picked.extend(next(ties) for _ in range(n - len(picked)))
+    picked.sort()
+    picked.sort(key=keys.__getitem__, reverse=largest)
+    return [items[i] for i in picked]
+
+
+def _top_numpy(items, n, key, largest):
+    if n == 1:
+        return [items[items.argmax() if largest else items.argmin()].item()]
+    size = len(items)
+    if largest:
+        part = np.partition(items, size - n)[size - n:]
+        return np.sort(part)[::-1].tolist()
+    return np.sort(np.partition(items, n - 1)[:n]).tolist()
+
+
+_TOP_STRATEGIES = {
+    'builtin': _top_builtin,
+    'heap': _top_heap,
+    'sort': _top_sort,
+    'select': _top_select,
+    'numpy': _top_numpy,
+}
+
+
+def _top_strategy(items, n, key):
+    if np is not None and isinstance(items, np.ndarray) and key is None:
+        return 'numpy'
+    size = len(items)
+    if n == 1:
+        return 'builtin'
+    if n >= size:
+        return 'sort'
+    if n * 40 <= size:
+        return 'heap'
+    if size >= 50000 and n * 5 <= size:
+        return 'select'
+    return 'sort'
+
+
+def select_top(items, n, key=None, largest=True):
+    if not isinstance(items, (list, tuple)) and not (
+            np is not None and isinstance(items, np.ndarray)):
+        items = list(items)
+    if n <= 0 or len(items) == 0:
+        return []
+    n = min(n, len(items))
+    strategy = _TOP_STRATEGIES[_top_strategy(items, n, key)]
+    return strategy(items, n, key, largest)
+
+
+print(select_top(nums, 3))  # [42, 37, 23]
+print(select_top(portfolio, 1, key=lambda s: s['price']))  # AAPL
+print(select_top(portfolio, 3, key=lambda s: s['price'], largest=False) == cheap)  # True
+
+#  The benchmark matrix times every strategy against select_top()
+#   and prints how much slower the dispatcher is than the best
+#   single strategy for each case (1.00x means it picked the best).
+#   With NumPy installed, each case is also run on an ndarray.
+#   Run the recipe with --bench to run the benchmark.
+
+
+def bench_select_top(sizes=(1000, 100000, 1000000),
+                     fractions=(0.001, 0.01, 0.1, 0.3, 0.9)):
+    import timeit
+    for size in sizes:
+        data = [random.random() for _ in range(size)]
+        inputs = [('list', data)]
+        if np is not None:
+            inputs.append(('ndarray', np.array(data)))
+        for kind, items in inputs:
+            for fraction in fractions:
+                n = max(1, int(size * fraction))
+                number = max(1, 100000 // size)
+                times = {}
+                for name in ('builtin', 'heap', 'sort', 'select', 'numpy'):
+                    if name == 'builtin' and n != 1:
+                        continue
+                    if name == 'numpy' and kind != 'ndarray':
+                        continue
+                    func = _TOP_STRATEGIES[name]
+                    times[name] = min(timeit.repeat(
+                        lambda: func(items, n, None, True),
+                        number=number, repeat=3))
+                chosen = min(timeit.repeat(
+                    lambda: select_top(items, n), number=number, repeat=3))
+                best = min(times, key=times.get)
+                print('{:<7} len={:<8} N={:<7} best={:<7} '
+                      'select_top={:.2f}x'.format(
+                          kind, size, n, best, chosen / times[best]))
+
+
+if __name__ == '__main__' and '--bench' in sys.argv:
+    bench_select_top()
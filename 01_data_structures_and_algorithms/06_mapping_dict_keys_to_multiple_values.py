@@ -68,3 +68,130 @@ for key, value in pairs:
 #  This recipe is related to the problem with needing to group
 #   records in data processing problems. 01.15 is an example of
 #   this.
+
+# Extension
+#  With tens of millions of pairs, defaultdict(list) becomes very
+#   expensive: every key gets its own list, and every value is a
+#   boxed int object with a pointer to it.
+#  When the multidict is built once and then only read, the values
+#   can instead be packed the way sparse matrices are (CSR). Each
+#   key is interned to a small integer id, all the values are stored
+#   back to back in one typed array, grouped by key, and an offsets
+#   array records where each key's values start and stop.
+#  from_pairs() collects the key ids and values in one pass, then
+#   sorts the positions by key id with sorted(), which is stable, so
+#   each key's values keep their insertion order. Counting the ids
+#   gives the size of each key's slice, and their running total
+#   gives the offsets. If NumPy is installed, the stable sort is
+#   done with np.argsort() instead.
+#  Looking up a key returns a memoryview over its slice of the
+#   values array, so no copy is made.
+
+import sys
+from array import array
+from collections import Counter
+from itertools import accumulate
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class CompactMultiDict:
+    def __init__(self, keys, offsets, values):
+        self._keys = keys
+        self._ids = {key: i for i, key in enumerate(keys)}
+        self._offsets = offsets
+        self._values = values
+
+    @classmethod
+    def from_pairs(cls, pairs, typecode='q'):
+        ids = {}
+        intern = ids.setdefault
+        key_ids = array('q')
+        values = array(typecode)
+        add_id = key_ids.append
+        add_value = values.append
+        for key, value in pairs:
+            add_id(intern(key, len(ids)))
+            add_value(value)
+
+        if np is not None:
+            order = np.argsort(np.frombuffer(key_ids, dtype='q'),
+                               kind='stable')
+            packed = np.frombuffer(values, dtype=typecode)[order]
+            packed = array(typecode, packed.tobytes())
+        else:
+            order = sorted(range(len(key_ids)), key=key_ids.__getitem__)
+            packed = array(typecode, map(values.__getitem__, order))
+        counts = Counter(key_ids)
+        offsets = array('q', [0])
+        offsets.extend(accumulate(counts[i] for i in range(len(ids))))
+        return cls(list(ids), offsets, packed)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._ids
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __getitem__(self, key):
+        i = self._ids[key]
+        return memoryview(self._values)[self._offsets[i]:self._offsets[i + 1]]
+
+    def items(self):
+        for key in self._keys:
+            yield key, self[key]
+
+
+d = CompactMultiDict.from_pairs(pairs)
+print(d['a'].tolist())  # [1, 2]
+print(d['b'].tolist())  # [4]
+
+#  The benchmark builds both structures from the same pairs and
+#   reports the build time and the memory allocated, as measured
+#   by tracemalloc. With a million pairs over 10,000 keys, the
+#   compact version takes about a quarter of the memory, but is a
+#   few times slower to build, since the pairs are still unpacked
+#   by a Python loop. Run the recipe with --bench to run it.
+
+
+def bench_multidict(count=1000000, keys=10000):
+    import random
+    import time
+    import tracemalloc
+
+    def make_pairs():
+        rand = random.Random(0)
+        for _ in range(count):
+            yield 'key{}'.format(rand.randrange(keys)), rand.randrange(10**9)
+
+    def build_defaultdict(pairs):
+        d = defaultdict(list)
+        for key, value in pairs:
+            d[key].append(value)
+        return d
+
+    for name, build in [('defaultdict(list)', build_defaultdict),
+                        ('CompactMultiDict', CompactMultiDict.from_pairs)]:
+        pairs = list(make_pairs())
+        start = time.perf_counter()
+        build(pairs)
+        elapsed = time.perf_counter() - start
+        del pairs
+        #  Build from a generator, so the value objects created while
+        #   building are counted against the structure that keeps them
+        tracemalloc.start()
+        d = build(make_pairs())
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del d
+        print('{:<18} {:.2f}s, {:,} bytes'.format(name, elapsed, size))
+
+
+if __name__ == '__main__' and '--bench' in sys.argv:
+    bench_multidict()
@@ -71,3 +71,87 @@ min(zip(prices.values(), prices.keys()))
 max(zip(prices.values(), prices.keys()))
 # (45.23, 'ZZZ')
 
+
+# Extension
+#  When the prices keep changing and the min, max or ranking is
+#   needed after every change, recomputing them with zip() is O(N) or
+#   O(NlogN) each time. A RankedDict keeps a sorted list of the same
+#   (value, key) pairs next to the dict, and updates it on every
+#   assignment or deletion instead.
+#  The bisect module finds where a pair goes (or where the old pair
+#   is) in O(logN). Inserting into or deleting from the list then
+#   shifts the pairs after it, which is a single memmove and stays
+#   fast well into the millions of keys.
+#  min() and max() are the two ends of the list, so they are O(1),
+#   and rank() is a bisect. Since the list holds (value, key) pairs,
+#   equal values are ordered by key exactly as in the zip() recipe.
+#   Unlike a zip() iterator, the index can be queried any number of
+#   times.
+
+from bisect import bisect_left, insort
+from collections.abc import MutableMapping
+
+
+class RankedDict(MutableMapping):
+    def __init__(self, *args, **kwargs):
+        self._data = {}
+        self._ranked = []
+        self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        if key in self._data:
+            self._unrank(key)
+        self._data[key] = value
+        insort(self._ranked, (value, key))
+
+    def __delitem__(self, key):
+        self._unrank(key)
+        del self._data[key]
+
+    def _unrank(self, key):
+        del self._ranked[bisect_left(self._ranked, (self._data[key], key))]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return 'RankedDict({!r})'.format(self._data)
+
+    def min(self):
+        return self._ranked[0]
+
+    def max(self):
+        return self._ranked[-1]
+
+    def rank(self, key):
+        #  Position of key in ascending order of (value, key)
+        return bisect_left(self._ranked, (self._data[key], key))
+
+    def smallest(self, n):
+        return self._ranked[:n]
+
+    def largest(self, n):
+        return self._ranked[:-n - 1:-1] if n > 0 else []
+
+
+prices = RankedDict({
+    'ACME': 45.23,
+    'AAPL': 612.78,
+    'IBM': 205.55,
+    'HPQ': 37.20,
+    'FB': 10.75
+})
+print(prices.min())  # (10.75, 'FB')
+print(prices.max())  # (612.78, 'AAPL')
+prices['FB'] = 700.00
+print(prices.max(), prices.rank('IBM'))  # (700.0, 'FB') 2
+print(prices.largest(2))  # [(700.0, 'FB'), (612.78, 'AAPL')]
+
+prices = RankedDict({'AAA': 45.23, 'ZZZ': 45.23})
+print(prices.min(), prices.max())  # (45.23, 'AAA') (45.23, 'ZZZ')
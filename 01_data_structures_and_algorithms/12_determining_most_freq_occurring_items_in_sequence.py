@@ -51,3 +51,585 @@ print(d)
 #  Counter objects are useful tools for tabulating
 #   and counting data. This should be used over
 #   over manually written solutions using dicts.
+
+# Extension
+#  When many threads update one Counter, they all need the same lock.
+#   A ShardedCounter gives each thread its own local Counter instead
+#   (through threading.local). Each shard has its own lock, which
+#   only merge() ever competes for, so counting never waits on other
+#   threads. Every flush_every updates, a thread folds its shard into
+#   the shared total, and merge() folds in all of them.
+#  Folding builds a new total and swaps it in, rather than changing
+#   the old one, so readers can use the total without a lock. This
+#   costs a copy of the total per flush, so flush_every should be
+#   large when there are many distinct keys. A read only sees counts
+#   that have been folded in so far.
+#  most_common(n) uses heapq.nlargest() (see 01.04), which is
+#   O(len log n) instead of sorting every key.
+#  For processes, count_parallel() counts each chunk with its own
+#   Counter in a process pool and adds the results together, since
+#   Counter instances can be combined. Pickling a chunk of tokens
+#   costs more than counting it, so the chunks are never sent: the
+#   pool is started with the fork start method, and each worker
+#   counts its chunk from the copy of the parent's memory it was
+#   forked with (as parallel_sort() does in 01.13). Only the Counters
+#   travel back. Where fork isn't available, the chunks are counted
+#   in this process instead.
+
+import heapq
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+class ShardedCounter:
+    def __init__(self, flush_every=100000):
+        self._total = Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        self._flush_every = flush_every
+
+    def _new_shard(self):
+        #  [lock, counter, items counted since the last flush]
+        shard = self._local.shard = [threading.Lock(), Counter(), 0]
+        with self._lock:
+            self._shards.append(shard)
+        return shard
+
+    def update(self, items):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        try:
+            size = len(items)
+        except TypeError:
+            items = list(items)
+            size = len(items)
+        with shard[0]:
+            shard[1].update(items)
+        shard[2] += size
+        if shard[2] >= self._flush_every:
+            self._fold([shard])
+            shard[2] = 0
+
+    def _fold(self, shards):
+        with self._lock:
+            total = self._total.copy()
+            for lock, counter, _ in shards:
+                with lock:
+                    total.update(counter)
+                    counter.clear()
+            self._total = total
+        return total
+
+    def merge(self):
+        return self._fold(list(self._shards))
+
+    def __getitem__(self, item):
+        return self._total[item]
+
+    def most_common(self, n):
+        return heapq.nlargest(n, self._total.items(), key=lambda kv: kv[1])
+
+
+_count_chunks = None
+
+
+def _count_chunk(index):
+    return Counter(_count_chunks[index])
+
+
+def count_parallel(chunks, workers=None):
+    global _count_chunks
+    chunks = list(chunks)
+    total = Counter()
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        for chunk in chunks:
+            total.update(chunk)
+        return total
+    _count_chunks = chunks
+    try:
+        with ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context('fork')
+        ) as executor:
+            for counts in executor.map(_count_chunk, range(len(chunks))):
+                total.update(counts)
+    finally:
+        _count_chunks = None
+    return total
+
+
+counter = ShardedCounter()
+threads = [threading.Thread(target=counter.update, args=(words,))
+           for _ in range(4)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+counter.merge()
+print(counter.most_common(3))  # [('eyes', 32), ('the', 20), ('look', 16)]
+
+if __name__ == '__main__':
+    print(count_parallel([words, more_words]).most_common(1))  # [('eyes', 9)]
+
+#  The benchmark counts the same words from more and more threads,
+#   once through a single Counter guarded by a lock and once
+#   through a ShardedCounter. Counter.update() holds the GIL while it
+#   counts, so on a regular CPython build threads gain nothing:
+#   ShardedCounter only keeps up with the locked Counter, within a
+#   few percent either way, at any number of threads. It only pays
+#   off where threads really run at the same time, such as a
+#   free-threaded build.
+#  It then counts a million tokens with one Counter and with
+#   count_parallel() for more and more workers. Starting the pool
+#   and sending the Counters back costs a fixed amount, so on a
+#   single core count_parallel() is slower (about 0.09s against
+#   0.06s); it only gains with several cores and large inputs.
+#  Run the recipe with --bench to run the benchmark.
+
+
+def bench_counters(batches=2000, batch_size=100, tokens=1000000):
+    import time
+    batch = (words * (batch_size // len(words) + 1))[:batch_size]
+
+    def run(threads, update):
+        workers = [threading.Thread(target=lambda: [update(batch) for _ in
+                                                    range(batches // threads)])
+                   for _ in range(threads)]
+        start = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        return batches * batch_size / (time.perf_counter() - start)
+
+    for threads in (1, 2, 4, 8):
+        shared = Counter()
+        lock = threading.Lock()
+
+        def locked_update(items):
+            with lock:
+                shared.update(items)
+
+        sharded = ShardedCounter()
+        print('{} threads: Counter+lock {:,.0f}/s, '
+              'ShardedCounter {:,.0f}/s'.format(
+                  threads, run(threads, locked_update),
+                  run(threads, sharded.update)))
+
+    tokens = batch * (tokens // len(batch))
+    start = time.perf_counter()
+    expected = Counter(tokens)
+    print('Counter:            {:.2f}s'.format(time.perf_counter() - start))
+    for workers in (1, 2, 4, 8):
+        size = -(-len(tokens) // workers)
+        start = time.perf_counter()
+        counts = count_parallel(
+            [tokens[i:i + size] for i in range(0, len(tokens), size)], workers)
+        print('count_parallel({}): {:.2f}s'.format(
+            workers, time.perf_counter() - start))
+        assert counts == expected
+
+
+if __name__ == '__main__' and '--bench' in sys.argv:
+    bench_counters()
+
+#  A Counter needs an entry for every distinct item, which is too
+#   much for hundreds of millions of distinct keys. When only the
+#   frequent items (heavy hitters) matter, two approximate structures
+#   use a fixed amount of memory instead, and keep the Counter
+#   methods update(), [], most_common() and +.
+#  Both hash items the same way in every process, so sketches built
+#   by different workers can be added together. Ints are scrambled
+#   with splitmix64, and other items are hashed with blake2b, since
+#   hash() of a str differs between processes.
+#  What blake2b hashes is a canonical encoding that starts with a
+#   type tag, so '1.5' and 1.5, or 'None' and None, don't share a
+#   counter. Items that compare equal get the same encoding: bools
+#   and integral floats are encoded as the equal int, and the items
+#   of a frozenset are sorted by their encoding. Only str, bytes,
+#   numbers, None and tuples or frozensets of those are accepted;
+#   anything else raises TypeError, since its repr() may contain a
+#   memory address or depend on the hash seed.
+
+import itertools
+import math
+from array import array
+from hashlib import blake2b
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_MASK64 = (1 << 64) - 1
+
+
+def _splitmix64(h):
+    h = ((h ^ (h >> 30)) * 0xbf58476d1ce4e5b9) & _MASK64
+    h = ((h ^ (h >> 27)) * 0x94d049bb133111eb) & _MASK64
+    return h ^ (h >> 31)
+
+
+def _canonical(item):
+    if type(item) is bool or (type(item) is float and item.is_integer()):
+        item = int(item)
+    if type(item) is str:
+        return b's' + item.encode('utf-8', 'surrogatepass')
+    if type(item) is bytes:
+        return b'b' + item
+    if type(item) is int:
+        return b'i' + str(item).encode()
+    if type(item) is float:
+        return b'f' + repr(item).encode()
+    if item is None:
+        return b'n'
+    if type(item) in (tuple, frozenset):
+        parts = [_canonical(part) for part in item]
+        if type(item) is frozenset:
+            parts.sort()
+        return (b't' if type(item) is tuple else b'z') + b''.join(
+            len(part).to_bytes(4, 'little') + part for part in parts)
+    raise TypeError("{!r} items can't be hashed the same way in every "
+                    "process".format(type(item).__name__))
+
+
+def _hash64(item):
+    if type(item) is bool or (type(item) is float and item.is_integer()):
+        item = int(item)
+    if type(item) is int and -(1 << 63) <= item < (1 << 63):
+        return _splitmix64(item & _MASK64)
+    data = _canonical(item)
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), 'little')
+
+
+def _np_hash64(keys):
+    h = np.asarray(keys, dtype=np.int64).astype(np.uint64)
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return h ^ (h >> np.uint64(31))
+
+
+#  A Count-Min Sketch keeps depth rows of width counters. Each item
+#   adds its count to one counter per row (picked by double hashing
+#   its 64-bit hash), and its estimate is the smallest of those
+#   counters. Collisions can only add to a counter, so an estimate
+#   is never too low. With width = ceil(e / epsilon) and depth =
+#   ceil(ln(1 / delta)), it is too high by at most epsilon * N (N
+#   being the total count) with probability 1 - delta.
+#  The sketch itself can't list its items, so it also tracks the
+#   `track` items with the highest estimates for most_common().
+#  update_hashed() takes a NumPy array of int keys and updates every
+#   row with np.add.at() in one call, giving the same result as
+#   update() on the same keys.
+
+class CountMinSketch:
+    def __init__(self, epsilon=0.001, delta=0.01, track=100):
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.total = 0
+        self._rows = [array('q', bytes(8 * self.width))
+                      for _ in range(self.depth)]
+        self._track = track
+        self._candidates = {}
+
+    def _columns(self, h):
+        h1, h2 = h & 0xffffffff, (h >> 32) | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def _estimate(self, h):
+        return min(row[col] for row, col in zip(self._rows, self._columns(h)))
+
+    def _add(self, item, count):
+        h = _hash64(item)
+        for row, col in zip(self._rows, self._columns(h)):
+            row[col] += count
+        self.total += count
+        self._consider(item, self._estimate(h))
+
+    def _consider(self, item, estimate):
+        candidates = self._candidates
+        candidates[item] = estimate
+        if len(candidates) > 2 * self._track:
+            keep = heapq.nlargest(self._track, candidates.items(),
+                                  key=lambda kv: kv[1])
+            self._candidates = dict(keep)
+
+    def update(self, items):
+        for item, count in Counter(items).items():
+            self._add(item, count)
+
+    def update_hashed(self, keys):
+        if np is None:
+            return self.update(keys)
+        keys, counts = np.unique(np.asarray(keys, dtype=np.int64),
+                                 return_counts=True)
+        h = _np_hash64(keys)
+        h1 = h & np.uint64(0xffffffff)
+        h2 = (h >> np.uint64(32)) | np.uint64(1)
+        estimates = None
+        for i, row in enumerate(self._rows):
+            cols = (h1 + np.uint64(i) * h2) % np.uint64(self.width)
+            cols = cols.astype(np.intp)
+            table = np.frombuffer(row, dtype=np.int64)
+            np.add.at(table, cols, counts)
+            found = table[cols]
+            if estimates is not None:
+                found = np.minimum(estimates, found)
+            estimates = found
+        self.total += int(counts.sum())
+        for item, estimate in zip(keys.tolist(), estimates.tolist()):
+            self._consider(item, estimate)
+
+    def __getitem__(self, item):
+        return self._estimate(_hash64(item))
+
+    def most_common(self, n):
+        found = ((item, self[item]) for item in self._candidates)
+        return heapq.nlargest(n, found, key=lambda kv: kv[1])
+
+    def __add__(self, other):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError('sketches must have the same width and depth')
+        result = CountMinSketch.__new__(CountMinSketch)
+        result.__dict__.update(self.__dict__)
+        result.total = self.total + other.total
+        result._rows = [array('q', (a + b for a, b in zip(row, other_row)))
+                        for row, other_row in zip(self._rows, other._rows)]
+        result._candidates = {}
+        for item in list(self._candidates) + list(other._candidates):
+            result._consider(item, result[item])
+        return result
+
+
+#  Space-Saving keeps exact counters for only k items. A new item
+#   takes over the counter of the item with the smallest count, and
+#   starts from that count (which is remembered as its possible
+#   error). Each count is then too high by at most N / k, and any
+#   item that occurs more than N / k times is guaranteed to be
+#   tracked. Items that aren't tracked report a count of 0.
+#  The smallest counter is found with a heap of (count, seq, item)
+#   entries whose stale entries are skipped when popped. seq is a
+#   running number, so equal counts never fall through to comparing
+#   the items themselves, which may not be orderable (like None and
+#   a str), and the oldest of equal counters is taken over first.
+#  Adding two summaries gives each item the sum of its counts, where
+#   an item missing from a full summary is charged that summary's
+#   smallest count, and keeps the k largest.
+
+class SpaceSaving:
+    def __init__(self, k=100):
+        self.k = k
+        self.total = 0
+        self._counts = {}
+        self._errors = {}
+        self._heap = []
+        self._seq = itertools.count()
+
+    def _smallest(self):
+        heap = self._heap
+        while heap[0][0] != self._counts.get(heap[0][2]):
+            heapq.heappop(heap)
+        return heap[0]
+
+    def _add(self, item, count):
+        counts = self._counts
+        self.total += count
+        if item in counts:
+            counts[item] += count
+        elif len(counts) < self.k:
+            counts[item] = count
+            self._errors[item] = 0
+        else:
+            smallest, _, evicted = self._smallest()
+            del counts[evicted], self._errors[evicted]
+            counts[item] = smallest + count
+            self._errors[item] = smallest
+        heapq.heappush(self._heap, (counts[item], next(self._seq), item))
+        if len(self._heap) > 4 * self.k:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        seq = self._seq
+        self._heap = [(c, next(seq), i) for i, c in self._counts.items()]
+        heapq.heapify(self._heap)
+
+    def update(self, items):
+        for item, count in Counter(items).items():
+            self._add(item, count)
+
+    def update_hashed(self, keys):
+        if np is None:
+            return self.update(keys)
+        keys, counts = np.unique(np.asarray(keys, dtype=np.int64),
+                                 return_counts=True)
+        for item, count in zip(keys.tolist(), counts.tolist()):
+            self._add(item, count)
+
+    def __getitem__(self, item):
+        return self._counts.get(item, 0)
+
+    def error(self, item):
+        return self._errors.get(item, 0)
+
+    def most_common(self, n):
+        return heapq.nlargest(n, self._counts.items(), key=lambda kv: kv[1])
+
+    def _floor(self):
+        if len(self._counts) < self.k:
+            return 0
+        return min(self._counts.values())
+
+    def __add__(self, other):
+        floors = self._floor(), other._floor()
+        merged = []
+        for item in self._counts.keys() | other._counts.keys():
+            count = (self._counts.get(item, floors[0]) +
+                     other._counts.get(item, floors[1]))
+            error = (self._errors.get(item, floors[0]) +
+                     other._errors.get(item, floors[1]))
+            merged.append((count, error, item))
+        result = SpaceSaving(max(self.k, other.k))
+        result.total = self.total + other.total
+        for count, error, item in heapq.nlargest(result.k, merged,
+                                                 key=lambda m: m[0]):
+            result._counts[item] = count
+            result._errors[item] = error
+        result._rebuild_heap()
+        return result
+
+
+sketch = CountMinSketch(epsilon=0.01, delta=0.01, track=10)
+sketch.update(words)
+print(sketch['eyes'], sketch.most_common(3))
+# 8 [('eyes', 8), ('the', 5), ('look', 4)]
+
+a = SpaceSaving(k=10)
+a.update(words)
+b = SpaceSaving(k=10)
+b.update(more_words)
+print((a + b).most_common(1))  # [('eyes', 9)]
+
+#  When the items come from a known vocabulary (or are small ints
+#   already), hashing every item into a Counter is wasted work. A
+#   CategoricalCounter maps each category to an integer code once,
+#   and counts codes with np.bincount(), which counts a whole array
+#   in one C loop.
+#  Codes are handed out in first-seen order by a dict, so the dict's
+#   keys double as the code-to-category table. dict.fromkeys() finds
+#   the distinct items in C, so only new categories are handled in
+#   Python. Token streams that are already encoded (or ints below
+#   some bound) can go straight to update_codes(), skipping the
+#   Python-level lookups altogether.
+#  most_common(n) finds the nth largest count with np.argpartition()
+#   and only sorts the counts at least that large. Like Counter, ties
+#   are listed in first-seen order. to_counter() converts back to a
+#   Counter for code that expects one.
+#  Without NumPy, the counts are kept in a plain list instead.
+
+class CategoricalCounter:
+    def __init__(self, vocabulary=()):
+        self._codes = {}
+        self._counts = np.zeros(0, dtype=np.int64) if np is not None else []
+        self.encode(vocabulary)
+
+    def encode(self, items):
+        if not isinstance(items, (list, tuple)):
+            items = list(items)
+        codes = self._codes
+        for item in dict.fromkeys(items):
+            if item not in codes:
+                codes[item] = len(codes)
+        if np is not None:
+            return np.fromiter(map(codes.__getitem__, items), np.intp,
+                               len(items))
+        return list(map(codes.__getitem__, items))
+
+    def update(self, items):
+        self.update_codes(self.encode(items))
+
+    def update_codes(self, codes):
+        size = len(self._codes)
+        if np is None:
+            self._counts.extend([0] * (size - len(self._counts)))
+            for code, count in Counter(codes).items():
+                self._counts[code] += count
+            return
+        counts = np.bincount(codes, minlength=size)
+        if len(counts) > size:
+            raise ValueError('codes must be below the number of categories')
+        counts[:len(self._counts)] += self._counts
+        self._counts = counts
+
+    def __getitem__(self, item):
+        code = self._codes.get(item)
+        if code is None or code >= len(self._counts):
+            return 0
+        return int(self._counts[code])
+
+    def most_common(self, n):
+        categories = list(self._codes)
+        counts = self._counts
+        if np is None:
+            top = heapq.nlargest(n, range(len(counts)), key=counts.__getitem__)
+            return [(categories[code], counts[code]) for code in top
+                    if counts[code]]
+        n = min(n, np.count_nonzero(counts))
+        if n <= 0:
+            return []
+        cut = len(counts) - n
+        nth = counts[np.argpartition(counts, cut)[cut]]
+        top = np.flatnonzero(counts > nth)
+        ties = np.flatnonzero(counts == nth)[:n - len(top)]
+        top = np.concatenate([top, ties])
+        top.sort()
+        top = top[np.argsort(-counts[top], kind='stable')]
+        return [(categories[code], int(counts[code])) for code in top.tolist()]
+
+    def to_counter(self):
+        return Counter({category: int(count) for category, count
+                        in zip(self._codes, self._counts) if count})
+
+
+counts = CategoricalCounter()
+counts.update(words)
+print(counts.most_common(3))  # [('eyes', 8), ('the', 5), ('look', 4)]
+print(counts.to_counter() == Counter(words))  # True
+
+#  The benchmark counts a stream of tokens drawn from a 10,000-word
+#   vocabulary. Encoding still has to look up every token in a dict,
+#   so encoding and counting together take up to twice as long as
+#   Counter: about 0.34s against 0.17s to 0.24s for 2 million tokens.
+#   Once the stream is encoded (as tokenizers usually produce it), or
+#   when the same codes are counted again, counting is well over an
+#   order of magnitude faster. Run the recipe with --bench to run it.
+
+
+def bench_categorical(count=2000000, vocabulary=10000):
+    import random
+    import time
+    rand = random.Random(0)
+    tokens = ['word{}'.format(rand.randrange(vocabulary)) for _ in range(count)]
+
+    start = time.perf_counter()
+    Counter(tokens).most_common(10)
+    print('Counter:        {:.3f}s'.format(time.perf_counter() - start))
+
+    counter = CategoricalCounter()
+    start = time.perf_counter()
+    codes = counter.encode(tokens)
+    counter.update_codes(codes)
+    counter.most_common(10)
+    print('encode + count: {:.3f}s'.format(time.perf_counter() - start))
+
+    start = time.perf_counter()
+    counter.update_codes(codes)
+    counter.most_common(10)
+    print('count codes:    {:.3f}s'.format(time.perf_counter() - start))
+
+
+if __name__ == '__main__' and '--bench' in sys.argv:
+    bench_categorical()
@@ -42,3 +42,136 @@ print(by_name)
 
 print(min(users, key=attrgetter('user_id')))
 print(max(users, key=attrgetter('user_id')))
+
+# Extension
+#  Calling min(), max() or sorted() for every query costs O(N) or
+#   O(NlogN) each time. When the same collection is queried over and
+#   over, a SortedIndex sorts it once by a field, and keeps a list of
+#   keys (from attrgetter() or itemgetter()) next to the objects in
+#   the same order.
+#  Lookups then use the bisect module on the keys: exact matches and
+#   ranges in O(logN), and min, max and the kth object in O(1).
+#  add() and remove() keep the lists sorted with bisect as well.
+#   Finding the position is O(logN), and the list insert or delete
+#   is a fast memmove. Objects with equal keys stay in the order they
+#   were added, just as sorted() would leave them.
+#  The key is read when an object is added, so change an indexed
+#   field by removing the object, changing it, and adding it again.
+#  Without a key, the objects are their own keys, as with sorted().
+#   remove() then takes out an equal object rather than only the very
+#   same one, since equal values can't be told apart.
+
+from bisect import bisect_left, bisect_right
+
+
+def _identity(obj):
+    return obj
+
+
+class SortedIndex:
+    def __init__(self, objs=(), key=None):
+        if key is None:
+            key = _identity
+        self._key = key
+        objs = sorted(objs, key=key)
+        self._keys = list(map(key, objs))
+        self._objs = objs
+
+    def __len__(self):
+        return len(self._objs)
+
+    def __iter__(self):
+        return iter(self._objs)
+
+    def add(self, obj):
+        k = self._key(obj)
+        pos = bisect_right(self._keys, k)
+        self._keys.insert(pos, k)
+        self._objs.insert(pos, obj)
+
+    def remove(self, obj):
+        k = self._key(obj)
+        lo = bisect_left(self._keys, k)
+        hi = bisect_right(self._keys, k, lo)
+        for pos in range(lo, hi):
+            if self._key is _identity or self._objs[pos] is obj:
+                del self._keys[pos], self._objs[pos]
+                return
+        raise ValueError('{!r} is not in the index'.format(obj))
+
+    def find(self, value):
+        lo = bisect_left(self._keys, value)
+        hi = bisect_right(self._keys, value, lo)
+        return self._objs[lo:hi]
+
+    def range(self, low=None, high=None, inclusive=True):
+        #  Objects with low <= key <= high (or < high if not inclusive)
+        lo = 0 if low is None else bisect_left(self._keys, low)
+        if high is None:
+            hi = len(self._keys)
+        elif inclusive:
+            hi = bisect_right(self._keys, high)
+        else:
+            hi = bisect_left(self._keys, high)
+        return self._objs[lo:hi]
+
+    def rank(self, value):
+        #  Number of objects with a key below value
+        return bisect_left(self._keys, value)
+
+    def kth(self, k):
+        return self._objs[k]
+
+    def min(self):
+        return self._objs[0]
+
+    def max(self):
+        return self._objs[-1]
+
+
+by_id = SortedIndex(users, key=attrgetter('user_id'))
+print(by_id.min(), by_id.max())  # User(3) User(99)
+print(by_id.range(20, 99, inclusive=False))  # [User(23)]
+print(by_id.kth(1), by_id.rank(50))  # User(23) 2
+by_id.remove(users[0])
+by_id.add(users[0])
+print(list(by_id))  # [User(3), User(23), User(99)]
+
+by_last = SortedIndex(avengers, key=attrgetter('lname', 'fname'))
+print(by_last.find(('Odenson', 'Thor')))  # [Thor Odenson]
+
+#  When only the first page of a sorted listing is shown, sorting
+#   every object is wasted work. sorted_page() asks heapq.nsmallest()
+#   (see 01.04) for just the first offset + limit objects, which keeps
+#   a bounded heap and costs O(Nlog(offset + limit)). Like sorted(),
+#   nsmallest() keeps objects with equal keys in their original order.
+#  For paging through the same listing, PagedSort goes one step
+#   further. It heapifies (key, index, obj) entries in O(N) once, and
+#   each page pops only as many entries as it needs, at O(logN) each.
+#   Entries already popped are kept in order, so earlier pages cost
+#   nothing, and later pages continue from where the last one ended.
+
+import heapq
+
+
+def sorted_page(objs, key, offset=0, limit=50):
+    return heapq.nsmallest(offset + limit, objs, key=key)[offset:]
+
+
+class PagedSort:
+    def __init__(self, objs, key):
+        self._heap = [(key(obj), i, obj) for i, obj in enumerate(objs)]
+        heapq.heapify(self._heap)
+        self._sorted = []
+
+    def page(self, offset=0, limit=50):
+        while len(self._sorted) < offset + limit and self._heap:
+            self._sorted.append(heapq.heappop(self._heap)[-1])
+        return self._sorted[offset:offset + limit]
+
+
+print(sorted_page(avengers, attrgetter('lname', 'fname'), limit=2))
+# [Bruce Banner, Loki Odenson]
+pages = PagedSort(avengers, key=attrgetter('lname', 'fname'))
+print(pages.page(0, 2))  # [Bruce Banner, Loki Odenson]
+print(pages.page(2, 2))  # [Thor Odenson, Peter Parker]
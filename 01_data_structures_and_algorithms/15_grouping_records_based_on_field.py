@@ -44,3 +44,204 @@ for r in rows_by_date['07/01/2012']:
 
 #  This might be preferred if memory if of no concern, and you want the
 #   code to possibly run faster.
+
+# Extension
+#  Both approaches above run on one core and need every record in
+#   memory. For large record streams, the grouping can be split up
+#   by hashing the key: every record with the same key lands in the
+#   same partition, so each partition can be grouped on its own.
+#  parallel_groupby() spills the (key, record) pairs of each
+#   partition to a temporary file in pickled batches, then groups
+#   the partitions in a process pool. Only one partition per worker
+#   has to fit in memory, so choose enough partitions for the data.
+#  If aggregates are given, the workers fold each record into a few
+#   running values per key (count, sum, min, max or first of a
+#   field) instead of building the groups, which keeps memory
+#   proportional to the number of keys rather than the records.
+#  The (key, group) pairs are streamed back one partition at a time.
+#   Keys come out in first-seen order within each partition. At most
+#   one partition per worker is being grouped or waiting to be read,
+#   so a slow consumer doesn't let finished partitions pile up.
+
+import os
+import pickle
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+_AGGREGATES = {
+    'count': (lambda value: 1, lambda acc, value: acc + 1),
+    'sum': (lambda value: value, lambda acc, value: acc + value),
+    'min': (lambda value: value, min),
+    'max': (lambda value: value, max),
+    'first': (lambda value: value, lambda acc, value: acc),
+}
+
+
+def _read_partition(filename):
+    with open(filename, 'rb') as f:
+        while True:
+            try:
+                yield from pickle.load(f)
+            except EOFError:
+                break
+
+
+def _group_partition(args):
+    filename, aggregates = args
+    groups = {}
+    if aggregates is None:
+        for key, record in _read_partition(filename):
+            groups.setdefault(key, []).append(record)
+        return list(groups.items())
+
+    specs = [_AGGREGATES[op] + (field,) for op, field in aggregates.values()]
+    for key, record in _read_partition(filename):
+        accs = groups.get(key)
+        if accs is None:
+            groups[key] = [start(None if field is None else record[field])
+                           for start, _, field in specs]
+        else:
+            for i, (_, fold, field) in enumerate(specs):
+                accs[i] = fold(accs[i], None if field is None else record[field])
+    return [(key, dict(zip(aggregates, accs)))
+            for key, accs in groups.items()]
+
+
+def parallel_groupby(records, key, partitions=16, aggregates=None,
+                     workers=None, batch_size=1000):
+    workers = workers or os.cpu_count()
+    with tempfile.TemporaryDirectory() as spill_dir:
+        filenames = [os.path.join(spill_dir, 'part{}.pickle'.format(i))
+                     for i in range(partitions)]
+        files = [open(filename, 'wb') for filename in filenames]
+        buffers = [[] for _ in range(partitions)]
+        try:
+            for record in records:
+                k = key(record)
+                part = hash(k) % partitions
+                buffers[part].append((k, record))
+                if len(buffers[part]) >= batch_size:
+                    pickle.dump(buffers[part], files[part])
+                    buffers[part].clear()
+            for f, buffer in zip(files, buffers):
+                if buffer:
+                    pickle.dump(buffer, f)
+        finally:
+            for f in files:
+                f.close()
+
+        with ProcessPoolExecutor(workers) as executor:
+            pending = deque()
+            for filename in filenames:
+                pending.append(executor.submit(_group_partition,
+                                               (filename, aggregates)))
+                if len(pending) >= workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+
+if __name__ == '__main__':
+    for date, items in sorted(parallel_groupby(rows, itemgetter('date'),
+                                               partitions=4)):
+        print(date, [i['address'] for i in items])
+
+    summary = parallel_groupby(rows, itemgetter('date'), partitions=4,
+                               aggregates={'visits': ('count', None),
+                                           'first': ('first', 'address')})
+    for date, totals in sorted(summary):
+        print(date, totals)
+    # 07/01/2012 {'visits': 2, 'first': '5412 N CLARK'} ...
+
+#  If the groups are wanted in sorted order, the records have to be
+#   sorted first, and rows.sort() needs all of them in memory. An
+#   external merge sort avoids that. The input is cut into runs of
+#   run_size records, each run is sorted in a worker process and
+#   written to a temporary file as pickled batches, and then
+#   heapq.merge() streams the runs back together in order, reading
+#   only one batch per run at a time.
+#  Only a few runs are in flight at once, so memory is bounded by
+#   run_size and the number of workers, not by the size of the input.
+#  sorted() and heapq.merge() are both stable, and the runs are
+#   merged in input order, so the result matches rows.sort() exactly
+#   and can be fed straight to groupby().
+#  The key is sent to the workers with each run, so it has to be
+#   picklable: itemgetter(), attrgetter() or a module-level function.
+#   A lambda or a nested function can't be pickled, so with one of
+#   those the runs are sorted in this process instead, one at a time.
+
+import heapq
+import time
+from itertools import islice
+
+
+def _sort_run(args):
+    records, key, filename, batch_size = args
+    records.sort(key=key)
+    with open(filename, 'wb') as f:
+        for i in range(0, len(records), batch_size):
+            pickle.dump(records[i:i + batch_size], f, pickle.HIGHEST_PROTOCOL)
+    return filename
+
+
+def external_sort(records, key, run_size=100000, workers=None,
+                  batch_size=1000):
+    workers = workers or os.cpu_count()
+    try:
+        pickle.dumps(key)
+        in_workers = True
+    except (pickle.PicklingError, AttributeError, TypeError):
+        in_workers = False
+    with tempfile.TemporaryDirectory() as spill_dir, \
+            ProcessPoolExecutor(workers) as executor:
+        filenames = []
+        pending = deque()
+        run = []
+        records = iter(records)
+        while True:
+            run.extend(islice(records, run_size))
+            if not run:
+                break
+            count = len(filenames) + len(pending)
+            filename = os.path.join(spill_dir, 'run{}.pickle'.format(count))
+            args = (run, key, filename, batch_size)
+            run = []
+            if not in_workers:
+                filenames.append(_sort_run(args))
+                continue
+            pending.append(executor.submit(_sort_run, args))
+            if len(pending) > workers:
+                filenames.append(pending.popleft().result())
+        filenames.extend(future.result() for future in pending)
+        yield from heapq.merge(*map(_read_partition, filenames), key=key)
+
+
+if __name__ == '__main__':
+    for date, items in groupby(external_sort(rows, itemgetter('date'),
+                                             run_size=3),
+                               key=itemgetter('date')):
+        print(date, [i['address'] for i in items])
+
+#  The benchmark sorts inputs of 1x, 10x and 100x the run size (the
+#   memory budget), with the records generated on the fly so the
+#   input itself is never held in memory. Run the recipe with --bench
+#   to run it.
+
+
+def bench_external_sort(run_size=10000):
+    import random
+    for factor in (1, 10, 100):
+        rand = random.Random(factor)
+        records = ({'address': i, 'date': rand.randrange(10**6)}
+                   for i in range(run_size * factor))
+        start = time.perf_counter()
+        count = sum(1 for _ in external_sort(records, itemgetter('date'),
+                                             run_size=run_size))
+        print('{:>3}x: {:,} records in {:.2f}s'.format(
+            factor, count, time.perf_counter() - start))
+
+
+if __name__ == '__main__' and '--bench' in sys.argv:
+    bench_external_sort()